@@ -1,64 +1,130 @@
 import cv2                   # OpenCV, Text Drawing Library
 import ctypes
 import numpy as np           # ndarray Library
-from mem_edit import Process # GPL Memory Scanning and Writing Library
+from mem_edit import Process, utils # GPL Memory Scanning and Writing Library
 import time
 import math
+import atexit
 
 magic_number_start = 1234567890
 magic_number_end   = 987654321
-shared_memory_ranges = []
+magic_start_buffer = ctypes.c_int32(magic_number_start) # Javascript writes the magic numbers as 32-bit ints
+magic_end_buffer   = ctypes.c_int32(magic_number_end)
+max_region_bytes   = 256 * 1024 * 1024 # The shared buffers are small; skip huge mappings when scanning
+max_shared_bytes   = 16 * 1024 * 1024  # Look for the end magic number at most this far past the start
+shared_memory_ranges = [] # (Process, start_addr, end_addr); Processes stay open while their ranges are in use
+control_probe      = ctypes.c_uint8() # Reused every frame to read the ownership byte from shared memory
+control_release    = ctypes.c_uint8(128) # Written to the ownership byte to hand the buffer back to Javascript
+
+def close_shared_memory_processes():
+    for p in {memory_range[0] for memory_range in shared_memory_ranges}:
+        p.close()
+    shared_memory_ranges.clear()
+
+def service_shared_memory_processes():
+    # Attached processes stop on every signal they receive until we let them carry on
+    for p in {memory_range[0] for memory_range in shared_memory_ranges}:
+        p.service_stops()
 
 def scan_for_shared_memory(process_name = 'chrome.exe'):
     global shared_memory_ranges
-    shared_memory_ranges.clear()
+    close_shared_memory_processes()
     for pid in Process.get_pids_by_name(process_name):
-        with Process.open_process(pid) as p:
-            # Search for Start and End Magic Numbers
-            start_addrs = p.search_all_memory(ctypes.c_long(magic_number_start))
+        p = Process(pid)
+        num_ranges = len(shared_memory_ranges)
+        try:
+            # Search for the Start Magic Number
+            start_addrs = p.search_all_memory(magic_start_buffer, max_region_bytes=max_region_bytes,
+                                              align=ctypes.alignment(magic_start_buffer), anonymous_only=True)
             if len(start_addrs) > 0:
                 print("Start Addresses:", start_addrs)
-                end_addrs = p.search_all_memory(ctypes.c_long(magic_number_end))
-                print("End Addresses:", end_addrs)
-
-                # If we have the same number of starts and ends, match them together!
-                if len(start_addrs) == len(end_addrs):
-                    for start_addr, end_addr in zip(start_addrs, end_addrs):
-                        if end_addr - start_addr > 8:
-                            shared_memory_ranges.append((pid, start_addr, end_addr))
-                        else:
-                            print("Memory range is too small to be shared! Skipping Process...")
-                            continue
-                else:
-                    print("Number of Start Addresses and End Addresses do not match! Skipping Process...")
-                    continue
+                regions = p.list_mapped_regions(max_region_bytes=max_region_bytes, anonymous_only=True)
+
+                # Only look for the End Magic Number in the memory following each start
+                for start_addr in start_addrs:
+                    # The memory map may have changed since the search
+                    region_stop = next((stop for start, stop in regions if start <= start_addr < stop), None)
+                    if region_stop is None:
+                        print("Region containing", start_addr, "is gone! Skipping...")
+                        continue
+
+                    tail = (ctypes.c_byte * min(max_shared_bytes, region_stop - start_addr))()
+                    try:
+                        p.read_memory(start_addr, tail)
+                    except OSError as err:
+                        print("Couldn't read memory after", start_addr, "(", err, ")! Skipping...")
+                        continue
+
+                    end_offsets = [offset for offset in utils.search_buffer_verbatim(magic_end_buffer, tail, align=ctypes.alignment(magic_end_buffer))
+                                   if offset > 8]
+                    if len(end_offsets) > 0:
+                        print("End Address:", start_addr + end_offsets[0])
+                        shared_memory_ranges.append((p, start_addr, start_addr + end_offsets[0]))
+                    else:
+                        print("No End Address found after", start_addr, "! Skipping...")
+        finally:
+            # Hold on to the process only if it has shared memory for us to write to
+            if len(shared_memory_ranges) == num_ranges:
+                p.close()
     return shared_memory_ranges
 
-def write_to_shared_memory(memory_ranges, input_array):
+def write_to_shared_memory(memory_ranges, frame):
   for memory_range in memory_ranges:
-    with Process.open_process(memory_range[0]) as p:
-        # Ensure that the beginning and ending magic numbers are still valid
-        #while (magic_number_start != p.read_memory(memory_range[1], ctypes.c_ulong()).value or
-        #       magic_number_end   != p.read_memory(memory_range[2], ctypes.c_ulong()).value):
-        #    print("Magic Numbers are not valid anymore!  Rescanning...")
-        #    scan_for_shared_memory()
+    p = memory_range[0]
 
-        beginning_addr = memory_range[1] + 8 # Add the header length to the start address
+    # Ensure that the beginning and ending magic numbers are still valid
+    #while (magic_number_start != p.read_memory(memory_range[1], ctypes.c_int32()).value or
+    #       magic_number_end   != p.read_memory(memory_range[2], ctypes.c_int32()).value):
+    #    print("Magic Numbers are not valid anymore!  Rescanning...")
+    #    scan_for_shared_memory()
 
-        # Check to see if Python has relinquished control of the memory and the array is shorter than the memory range
-        if (p.read_memory(memory_range[1] + 4, ctypes.c_ulong()).value == 0 and
-            memory_range[2] - beginning_addr >= input_array.size * input_array.itemsize):
+    beginning_addr = memory_range[1] + 8 # Add the header length to the start address
 
-            # Write the current array into shared memory
-            p.write_memory_pointer(beginning_addr, input_array.ctypes.data_as(ctypes.POINTER(ctypes.c_uint8)), input_array.size)
+    # Check to see if the array is shorter than the memory range and Javascript has relinquished control of the memory
+    if (memory_range[2] - beginning_addr >= len(frame) and
+        p.read_memory(memory_range[1] + 4, control_probe).value == 0):
 
-            # Write a zero to the fifth number in the array, giving control back to javascript
-            p.write_memory(memory_range[1] + 4, ctypes.c_uint8(128))
+        # Write the current frame into shared memory, then write 128 to the fifth byte, giving control back to javascript
+        p.write_iov([(beginning_addr, frame), (memory_range[1] + 4, control_release)])
 
-# Initialize the shared memory ranges
+# Initialize the shared memory ranges, making sure any processes kept open are released on exit
+atexit.register(close_shared_memory_processes)
 scan_for_shared_memory()
 
-test_array = np.ones((480, 640, 4), dtype=np.uint8) * 129
+test_array = np.full((480, 640, 4), 129, dtype=np.uint8)
+
+# The frame is only ever modified in-place, so a byte view of it can be built once and written every frame
+assert test_array.flags['C_CONTIGUOUS']
+test_frame = (ctypes.c_uint8 * test_array.nbytes).from_buffer(test_array)
+
+# Lookup table for the per-frame fade (0.9 * value + 0.1 * 129), applied in-place; computed in exact integer arithmetic
+fade_lut = ((np.arange(256, dtype=np.uint16) * 9 + 129) // 10).astype(np.uint8)
+
+# Rasterize the text once: its color (premultiplied by coverage) and the inverse of its coverage,
+# so each frame only has to composite this small overlay instead of re-drawing the glyphs
+text, text_font, text_scale, text_color, text_thickness = 'Hello from PyWebMem!', cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2
+(text_w, text_h), text_baseline = cv2.getTextSize(text, text_font, text_scale, text_thickness)
+text_origin = (text_thickness, text_thickness + text_h) # Where the text's origin falls inside the overlay
+text_overlay = np.zeros((text_h + text_baseline + 2 * text_thickness, text_w + 2 * text_thickness, 4), dtype=np.uint8)
+text_coverage = np.zeros(text_overlay.shape[:2], dtype=np.uint8)
+cv2.putText(text_overlay,  text, text_origin, text_font, text_scale, text_color, text_thickness, cv2.LINE_AA)
+cv2.putText(text_coverage, text, text_origin, text_font, text_scale, 255,        text_thickness, cv2.LINE_AA)
+# The overlay's alpha channel stays 0, so (like putText with a 3-component color) the text blends the frame's alpha toward 0
+text_inverse_alpha = cv2.merge([255 - text_coverage] * 4)
+
+def draw_text_overlay(frame, x, y):
+    # Clip the overlay (placed so that the text's origin lands on (x, y)) against the frame
+    top, left = y - text_origin[1], x - text_origin[0]
+    y0, x0 = max(top, 0), max(left, 0)
+    y1, x1 = min(top + text_overlay.shape[0], frame.shape[0]), min(left + text_overlay.shape[1], frame.shape[1])
+    if y0 >= y1 or x0 >= x1:
+        return
+
+    roi = frame[y0:y1, x0:x1]
+    overlay_region = (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+    cv2.multiply(roi, text_inverse_alpha[overlay_region], dst=roi, scale=1 / 255)
+    cv2.add(roi, text_overlay[overlay_region], dst=roi)
+
 start_time = time.time()
 
 print("Running spinner for 10 seconds...")
@@ -66,9 +132,10 @@ while time.time() - start_time < 10.0:
     x_pos = int(math.cos(time.time() * 2) * 100) + 120
     y_pos = int(math.sin(time.time() * 2) * 100) + 220
 
-    test_array = cv2.putText(test_array, 'Hello from PyWebMem!', (x_pos, y_pos), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA)
-    test_array = ((test_array.astype(float) * 0.9) + (129 * 0.1)).astype(np.uint8)
-    write_to_shared_memory(shared_memory_ranges, test_array)
+    cv2.LUT(test_array, fade_lut, dst=test_array)
+    draw_text_overlay(test_array, x_pos, y_pos)
+    write_to_shared_memory(shared_memory_ranges, test_frame)
+    service_shared_memory_processes()
 
     #time.sleep(0.0001)
 
@@ -2,12 +2,17 @@
 Abstract class for cross-platform memory editing.
 """
 
-from typing import List, Tuple, Optional, Union, Generator
+from typing import List, Tuple, Optional, Union, Generator, Callable
 from abc import ABCMeta, abstractmethod
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import copy
 import ctypes
+import functools
+import itertools
 import logging
+import os
+import threading
 
 from . import utils
 from .utils import ctypes_buffer_t
@@ -121,6 +126,9 @@ class Process(metaclass=ABCMeta):
     ```
     """
 
+    search_chunk_size = 1 << 20
+    """ Number of bytes read from the process at a time by `search_all_memory(...)` """
+
     @abstractmethod
     def __init__(self, process_id: int):
         """
@@ -146,6 +154,15 @@ class Process(metaclass=ABCMeta):
         """
         pass
 
+    def service_stops(self):
+        """
+        Let the process carry on from any stops it has entered because we're attached to it.
+
+        On platforms where attaching makes signals stop the process until they're handled by
+          us (Linux), call this periodically while holding the process open; it's a no-op elsewhere.
+        """
+        pass
+
     @abstractmethod
     def write_memory(self, base_address: int, write_buffer: ctypes_buffer_t):
         """
@@ -187,8 +204,80 @@ class Process(metaclass=ABCMeta):
         """
         pass
 
+    def read_bytes(self, base_address: int, size: int) -> bytes:
+        """
+        Read `size` bytes from the process's address space, starting at `base_address`,
+          and return them as a `bytes` object.
+
+        Args:
+            base_address: The address to read from, in the process's address space.
+            size: Number of bytes to read.
+
+        Returns:
+            The bytes which were read.
+        """
+        read_buffer = (ctypes.c_char * size)()
+        self.read_memory(base_address, read_buffer)
+        return read_buffer.raw
+
+    def write_iov(self, writes: List[Tuple[int, ctypes_buffer_t]]):
+        """
+        Write several buffers into the process's address space, in order.
+
+        Equivalent to calling `.write_memory(base_address, write_buffer)` for each pair,
+          but platform implementations may perform all of the writes in a single system call.
+
+        Args:
+            writes: List of `(base_address, write_buffer)` pairs.
+        """
+        for base_address, write_buffer in writes:
+            self.write_memory(base_address, write_buffer)
+
+    def read_iov(self, reads: List[Tuple[int, ctypes_buffer_t]]) -> List[ctypes_buffer_t]:
+        """
+        Read from several places in the process's address space, in order.
+
+        Equivalent to calling `.read_memory(base_address, read_buffer)` for each pair,
+          but platform implementations may perform all of the reads in a single system call.
+
+        Args:
+            reads: List of `(base_address, read_buffer)` pairs.
+
+        Returns:
+            List of the `read_buffer`s, which are overwritten as well.
+        """
+        return [self.read_memory(base_address, read_buffer) for base_address, read_buffer in reads]
+
+    def read_regions(self, regions: List[Tuple[int, int]]) -> List[bytearray]:
+        """
+        Read several regions of the process's address space, returning a `bytearray` with
+          the contents of each.
+
+        Each read blocks while the kernel walks the target's page tables, so the reads are
+          spread over a small pool of threads rather than issued one after another. Every
+          region is read directly into the `bytearray` which is returned for it.
+
+        Args:
+            regions: List of `(base_address, size)` pairs.
+
+        Returns:
+            List of the data read from each region, in the same order as `regions`.
+        """
+        def read_region(region: Tuple[int, int]) -> bytearray:
+            base_address, size = region
+            data = bytearray(size)
+            self.read_memory(base_address, (ctypes.c_char * size).from_buffer(data))
+            return data
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            return list(executor.map(read_region, regions))
+
     @abstractmethod
-    def list_mapped_regions(self, writeable_only=True) -> List[Tuple[int, int]]:
+    def list_mapped_regions(self,
+                            writeable_only: bool = True,
+                            max_region_bytes: Optional[int] = None,
+                            anonymous_only: bool = False,
+                            ) -> List[Tuple[int, int]]:
         """
         Return a list of `(start_address, stop_address)` for the regions of the address space
           accessible to (readable and possibly writable by) the process.
@@ -197,6 +286,10 @@ class Process(metaclass=ABCMeta):
         Args:
             writeable_only: If `True`, only return regions which are also writeable.
                 Default `True`.
+            max_region_bytes: If not `None`, skip regions larger than this many bytes.
+                Default `None`.
+            anonymous_only: If `True`, only return regions which are not backed by a file
+                (e.g. heap allocations). Default `False`.
 
         Returns:
             List of `(start_address, stop_address)` for each accessible memory region.
@@ -299,8 +392,13 @@ class Process(metaclass=ABCMeta):
         read_buffer = copy.copy(needle_buffer)
 
         if verbatim:
+            # Only the freshly-read bytes need converting on each comparison
+            needle_bytes = bytes(needle_buffer)
+            read_address = ctypes.addressof(read_buffer)
+            read_size = ctypes.sizeof(read_buffer)
+
             def compare(a, b):
-                return bytes(read_buffer) == bytes(needle_buffer)
+                return ctypes.string_at(read_address, read_size) == needle_bytes
         else:
             compare = utils.ctypes_equal
 
@@ -314,6 +412,10 @@ class Process(metaclass=ABCMeta):
                           needle_buffer: ctypes_buffer_t,
                           writeable_only: bool = True,
                           verbatim: bool = True,
+                          max_region_bytes: Optional[int] = None,
+                          parallel: bool = False,
+                          align: int = 1,
+                          anonymous_only: bool = False,
                           ) -> List[int]:
         """
         Search the entire memory space accessible to the process for the provided value.
@@ -326,23 +428,92 @@ class Process(metaclass=ABCMeta):
                 Default `True`.
             verbatim: If `True`, perform bitwise comparison when searching for `needle_buffer`.
                 If `False`, perform `utils.ctypes_equal-based` comparison. Default `True`.
+            max_region_bytes: If not `None`, skip regions larger than this many bytes.
+                Default `None`.
+            parallel: If `True`, search regions concurrently using a pool of threads (one per
+                CPU). Reads and the vectorized searches release the GIL, so this helps when
+                scanning large address spaces. Default `False`.
+            align: Only report addresses which are a multiple of `align` (at least 1). Passing
+                `ctypes.alignment(needle_buffer)` skips unaligned positions, which speeds up
+                searching for values the target process stores aligned. Default 1.
+            anonymous_only: If `True`, only search regions which are not backed by a file.
+                Default `False`.
 
         Returns:
             List of addresses where the `needle_buffer` was found.
         """
+        if align < 1:
+            raise ValueError('align must be a positive integer, got {}'.format(align))
+
         found = []
         if verbatim:
-            search = utils.search_buffer_verbatim
+            scan = utils.compile_needle_scanner(needle_buffer, align)
         else:
-            search = utils.search_buffer
+            scan = functools.partial(utils.search_buffer, needle_buffer, align=align)
+
+        # Regions are read through a fixed-size buffer. Consecutive chunks overlap by
+        #  one byte less than the needle, so every match lies entirely inside exactly
+        #  one chunk and is reported once. The scanners filter on chunk-relative alignment,
+        #  so every chunk has to start on an aligned address: each region's first chunk starts
+        #  at its first aligned address (no match can start before it), and the chunk size is
+        #  rounded up to a multiple of `align`.
+        chunk_size = -(-self.search_chunk_size // align) * align
+        overlap = ctypes.sizeof(needle_buffer) - 1
+        regions = self.list_mapped_regions(writeable_only, max_region_bytes, anonymous_only)
+        if align > 1:
+            regions = [(start + -start % align, stop) for start, stop in regions]
+
+        if parallel:
+            thread_local = threading.local()
+
+            def search_region(region):
+                if not hasattr(thread_local, 'chunk_buffer'):
+                    thread_local.chunk_buffer = (ctypes.c_byte * (chunk_size + overlap))()
+                return self._search_region(*region, scan, chunk_size, thread_local.chunk_buffer)
+
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                return list(itertools.chain.from_iterable(executor.map(search_region, regions)))
+
+        chunk_buffer = (ctypes.c_byte * (chunk_size + overlap))()
+        for start, stop in regions:
+            found += self._search_region(start, stop, scan, chunk_size, chunk_buffer)
+        return found
+
+    def _search_region(self,
+                       start: int,
+                       stop: int,
+                       scan: Callable[[ctypes_buffer_t], List[int]],
+                       chunk_size: int,
+                       chunk_buffer: ctypes.Array,
+                       ) -> List[int]:
+        """
+        Search the region `[start, stop)` chunk-by-chunk, reading through `chunk_buffer`.
+
+        Args:
+            start: First address of the region.
+            stop: Address one past the end of the region.
+            scan: Function returning the offsets of the needle within a buffer, e.g. one
+                made by `utils.compile_needle_scanner(...)`.
+            chunk_size: Distance between the starts of consecutive chunks.
+            chunk_buffer: Scratch buffer of `chunk_size + sizeof(needle) - 1` bytes.
+
+        Returns:
+            List of addresses where the needle was found.
+        """
+        found = []
+        for chunk_start in range(start, stop, chunk_size):
+            read_size = min(len(chunk_buffer), stop - chunk_start)
+            if read_size < len(chunk_buffer):
+                chunk = (ctypes.c_byte * read_size).from_buffer(chunk_buffer)
+            else:
+                chunk = chunk_buffer
 
-        for start, stop in self.list_mapped_regions(writeable_only):
             try:
-                region_buffer = (ctypes.c_byte * (stop - start))()
-                self.read_memory(start, region_buffer)
-                found += [offset + start for offset in search(needle_buffer, region_buffer)]
+                self.read_memory(chunk_start, chunk)
             except OSError:
-                logger.error('Failed to read in range  0x{} - 0x{}'.format(start, stop))
+                logger.error('Failed to read in range 0x{:x} - 0x{:x}'.format(chunk_start, stop))
+                break
+            found += [offset + chunk_start for offset in scan(chunk)]
         return found
 
     @classmethod
@@ -2,8 +2,9 @@
 Implementation of Process class for Linux
 """
 
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Generator
 from os import strerror
+import errno
 import os
 import os.path
 import signal
@@ -21,12 +22,18 @@ logger = logging.getLogger(__name__)
 ptrace_commands = {
     'PTRACE_GETREGS': 12,
     'PTRACE_SETREGS': 13,
+    'PTRACE_CONT': 7,
     'PTRACE_ATTACH': 16,
     'PTRACE_DETACH': 17,
     'PTRACE_SYSCALL': 24,
     'PTRACE_SEIZE': 16902,
+    'PTRACE_INTERRUPT': 16903,
+    'PTRACE_LISTEN': 16904,
     }
 
+# waitpid() status event (status >> 16) for group-stops and PTRACE_INTERRUPT stops
+PTRACE_EVENT_STOP = 128
+
 
 # import ptrace() from libc
 _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
@@ -35,6 +42,21 @@ _ptrace.argtypes = (ctypes.c_ulong,) * 4
 _ptrace.restype = ctypes.c_long
 
 
+# import process_vm_readv() and process_vm_writev() from libc
+class iovec(ctypes.Structure):
+    _fields_ = [
+        ('iov_base', ctypes.c_void_p),
+        ('iov_len', ctypes.c_size_t),
+        ]
+
+_process_vm_readv = _libc.process_vm_readv
+_process_vm_writev = _libc.process_vm_writev
+for _func in (_process_vm_readv, _process_vm_writev):
+    _func.argtypes = (ctypes.c_int, ctypes.POINTER(iovec), ctypes.c_ulong,
+                      ctypes.POINTER(iovec), ctypes.c_ulong, ctypes.c_ulong)
+    _func.restype = ctypes.c_ssize_t
+
+
 def ptrace(command: int, pid: int = 0, arg1: int = 0, arg2: int = 0) -> int:
     """
     Call ptrace() with the provided pid and arguments. See the ```man ptrace```.
@@ -49,96 +71,230 @@ def ptrace(command: int, pid: int = 0, arg1: int = 0, arg2: int = 0) -> int:
     return result
 
 
+def _read_cmdline_path(pid: int) -> str:
+    """
+    Return the first entry (the executable path, as invoked) of `/proc/<pid>/cmdline`.
+    """
+    with open('/proc/{}/cmdline'.format(pid), 'rb') as cmdline:
+        return cmdline.read().decode().split('\x00')[0]
+
+
+def _process_has_name(pid: int, target_name: str) -> bool:
+    """
+    Check whether process `pid` was run from an executable file named `target_name`.
+
+    Both the file `/proc/<pid>/exe` resolves to and the first entry of `/proc/<pid>/cmdline`
+      (the path as invoked) are checked, since resolving the exe link follows symlinks
+      (e.g. `python3` -> `python3.11`) and the exe link is off-limits for some processes.
+    """
+    try:
+        path = os.readlink('/proc/{}/exe'.format(pid))
+    except PermissionError:
+        pass
+    else:
+        if path.endswith(' (deleted)'):
+            path = path[:-len(' (deleted)')]
+        logger.debug('Executable was "{}"'.format(path))
+        if os.path.basename(path) == target_name:
+            return True
+
+    path = _read_cmdline_path(pid)
+    logger.debug('Command was "{}"'.format(path))
+    return os.path.basename(path) == target_name
+
+
+def _is_anonymous_region_name(name: str) -> bool:
+    """
+    Check whether the pathname column of a `/proc/<pid>/maps` entry denotes anonymous memory.
+    """
+    return (name in ('', '[heap]', '[stack]')
+            or name.startswith('[anon:')
+            or name.startswith('[stack:'))
+
+
 class Process(AbstractProcess):
     pid = None
+    mem_fd = None
 
     def __init__(self, process_id: int):
-        ptrace(ptrace_commands['PTRACE_SEIZE'], process_id)
+        self.mem_fd = os.open('/proc/{}/mem'.format(process_id), os.O_RDWR)
+        try:
+            ptrace(ptrace_commands['PTRACE_SEIZE'], process_id)
+        except MemEditError:
+            os.close(self.mem_fd)
+            raise
         self.pid = process_id
 
     def close(self):
-        os.kill(self.pid, signal.SIGSTOP)
-        os.waitpid(self.pid, 0)
-        ptrace(ptrace_commands['PTRACE_DETACH'], self.pid, 0, 0)
-        os.kill(self.pid, signal.SIGCONT)
+        os.close(self.mem_fd)
+        self.mem_fd = None
+        # The process was attached with PTRACE_SEIZE, so it keeps running while we access
+        #  /proc/<pid>/mem. It only needs to be stopped briefly in order to detach, which
+        #  PTRACE_INTERRUPT does without sending it any signals.
+        ptrace(ptrace_commands['PTRACE_INTERRUPT'], self.pid, 0, 0)
+
+        # Since nobody waits on the process while it's attached, any signal sent to it in the
+        #  meantime leaves it in a signal-delivery-stop, which waitpid() reports before the
+        #  interrupt. Detaching is allowed from any ptrace-stop, so detach from whichever one
+        #  we get, passing that signal back so that it's delivered rather than dropped.
+        #  (Detaching also cancels the interrupt if it hasn't taken effect yet.)
+        _pid, status = os.waitpid(self.pid, 0)
+        if os.WIFSTOPPED(status):
+            if status >> 16 == PTRACE_EVENT_STOP:
+                deliver_signal = 0
+            else:
+                deliver_signal = os.WSTOPSIG(status)
+            ptrace(ptrace_commands['PTRACE_DETACH'], self.pid, 0, deliver_signal)
         self.pid = None
 
+    def service_stops(self):
+        """
+        Resume the process from any ptrace-stops it has entered since the last call.
+
+        While the process is attached, every signal sent to it stops it (in a
+          signal-delivery-stop) until its tracer -- us -- resumes it, so a process which is
+          held open has to be serviced periodically or it freezes on its first signal.
+        Each signal is passed back to the process so it's delivered as usual; if that puts
+          the process in a group-stop (e.g. SIGSTOP), it's left stopped until it gets SIGCONT.
+        """
+        while True:
+            try:
+                pid, status = os.waitpid(self.pid, os.WNOHANG)
+            except ChildProcessError:
+                return      # Already reaped: the process exited
+            if pid == 0 or not os.WIFSTOPPED(status):
+                return
+
+            stop_signal = os.WSTOPSIG(status)
+            if status >> 16 != PTRACE_EVENT_STOP:
+                ptrace(ptrace_commands['PTRACE_CONT'], self.pid, 0, stop_signal)
+            elif stop_signal == signal.SIGTRAP:
+                # PTRACE_INTERRUPT stop
+                ptrace(ptrace_commands['PTRACE_CONT'], self.pid, 0, 0)
+            else:
+                # Group-stop: stay stopped, but let us hear about the SIGCONT which ends it
+                ptrace(ptrace_commands['PTRACE_LISTEN'], self.pid, 0, 0)
+
     def write_memory(self, base_address: int, write_buffer: ctypes_buffer_t):
-        with open('/proc/{}/mem'.format(self.pid), 'rb+') as mem:
-            mem.seek(base_address)
-            mem.write(write_buffer)
+        os.pwrite(self.mem_fd, write_buffer, base_address)
 
-    def write_memory(self, base_address: int, write_buffer: ctypes_buffer_t, size: int):
-        raise NotImplementedError
-        #with open('/proc/{}/mem'.format(self.pid), 'rb+') as mem:
-        #    mem.seek(base_address)
-        #    mem.write(write_buffer)
+    def write_memory_pointer(self, base_address: int, write_pointer: ctypes_buffer_t, size: int):
+        address = ctypes.cast(write_pointer, ctypes.c_void_p).value
+        self._transfer_iov(_process_vm_writev, [(base_address, address, size)])
 
     def read_memory(self, base_address: int, read_buffer: ctypes_buffer_t) -> ctypes_buffer_t:
-        with open('/proc/{}/mem'.format(self.pid), 'rb+') as mem:
-            mem.seek(base_address)
-            mem.readinto(read_buffer)
+        view = memoryview(read_buffer).cast('B')
+        # /proc/<pid>/mem stops early, without an error, at the first unmapped page
+        self._check_read_size(base_address, os.preadv(self.mem_fd, [view], base_address), len(view))
         return read_buffer
 
+    def read_bytes(self, base_address: int, size: int) -> bytes:
+        data = os.pread(self.mem_fd, size, base_address)
+        self._check_read_size(base_address, len(data), size)
+        return data
+
+    def _check_read_size(self, base_address: int, read_size: int, expected: int):
+        """
+        Raise `OSError` if a read starting at `base_address` returned fewer bytes than requested.
+        """
+        if read_size != expected:
+            raise OSError(errno.EIO, 'Short read from pid {} at 0x{:x}: {} of {} bytes'.format(
+                self.pid, base_address, read_size, expected))
+
+    def write_iov(self, writes: List[Tuple[int, ctypes_buffer_t]]):
+        self._transfer_iov(_process_vm_writev, [(base_address, ctypes.addressof(write_buffer), ctypes.sizeof(write_buffer))
+                                                for base_address, write_buffer in writes])
+
+    def read_iov(self, reads: List[Tuple[int, ctypes_buffer_t]]) -> List[ctypes_buffer_t]:
+        self._transfer_iov(_process_vm_readv, [(base_address, ctypes.addressof(read_buffer), ctypes.sizeof(read_buffer))
+                                               for base_address, read_buffer in reads])
+        return [read_buffer for _base_address, read_buffer in reads]
+
+    def _transfer_iov(self, function, transfers: List[Tuple[int, int, int]]):
+        """
+        Copy between our memory and the process's memory with a single call to
+          `process_vm_readv()` or `process_vm_writev()` (passed as `function`).
+
+        Unlike `/proc/<pid>/mem`, these calls respect page protections, so they can't
+          be used to write to read-only memory.
+
+        Args:
+            function: `_process_vm_readv` or `_process_vm_writev`.
+            transfers: List of `(remote_address, local_address, size)` triples.
+        """
+        count = len(transfers)
+        local_iov = (iovec * count)()
+        remote_iov = (iovec * count)()
+        for i, (remote_address, local_address, size) in enumerate(transfers):
+            local_iov[i].iov_base = local_address
+            local_iov[i].iov_len = size
+            remote_iov[i].iov_base = remote_address
+            remote_iov[i].iov_len = size
+
+        result = function(self.pid, local_iov, count, remote_iov, count, 0)
+        if result == -1:
+            err_no = ctypes.get_errno()
+            raise OSError(err_no, strerror(err_no))
+
+        expected = sum(size for _remote_address, _local_address, size in transfers)
+        if result != expected:
+            raise MemEditError('Partial transfer with pid {}: {} of {} bytes'.format(self.pid, result, expected))
+
     def get_path(self) -> str:
         try:
-            with open('/proc/{}/cmdline', 'rb') as f:
-                return f.read().decode().split('\x00')[0]
+            return _read_cmdline_path(self.pid)
         except FileNotFoundError:
             return ''
 
     @staticmethod
     def list_available_pids() -> List[int]:
-        pids = []
-        for pid_str in os.listdir('/proc'):
-            try:
-                pids.append(int(pid_str))
-            except ValueError:
-                continue
-        return pids
+        with os.scandir('/proc') as entries:
+            return [int(entry.name) for entry in entries if entry.name.isdigit()]
 
     @staticmethod
     def get_pid_by_name(target_name: str) -> Optional[int]:
-        for pid in Process.list_available_pids():
-            try:
-                logger.debug('Checking name for pid {}'.format(pid))
-                with open('/proc/{}/cmdline'.format(pid), 'rb') as cmdline:
-                    path = cmdline.read().decode().split('\x00')[0]
-            except FileNotFoundError:
-                continue
+        pid = next(Process._iter_pids_by_name(target_name), None)
+        if pid is None:
+            logger.info('Found no process with name {}'.format(target_name))
+        return pid
 
-            name = os.path.basename(path)
-            logger.debug('Name was "{}"'.format(name))
-            if path is not None and name == target_name:
-                return pid
-
-        logger.info('Found no process with name {}'.format(target_name))
-        return None
+    @staticmethod
+    def get_pids_by_name(target_name: str) -> List[int]:
+        return list(Process._iter_pids_by_name(target_name))
 
     @staticmethod
-    def get_pids_by_name(target_name: str) -> Optional[int]:
-        pids = []
+    def _iter_pids_by_name(target_name: str) -> Generator[int, None, None]:
+        """
+        Yield the pid of each process whose executable file is named `target_name`.
+
+        See `_process_has_name(...)` for how the name is determined.
+        """
         for pid in Process.list_available_pids():
+            logger.debug('Checking name for pid {}'.format(pid))
             try:
-                logger.debug('Checking name for pid {}'.format(pid))
-                with open('/proc/{}/cmdline'.format(pid), 'rb') as cmdline:
-                    path = cmdline.read().decode().split('\x00')[0]
-            except FileNotFoundError:
-                continue
+                matches = _process_has_name(pid, target_name)
+            except (FileNotFoundError, ProcessLookupError, PermissionError):
+                continue        # process exited, is a kernel thread, or is off-limits
 
-            name = os.path.basename(path)
-            logger.debug('Name was "{}"'.format(name))
-            if path is not None and name == target_name:
-                pids.append(pid)
+            if matches:
+                yield pid
 
-        #logger.info('Found no process with name {}'.format(target_name))
-        return pids
+    def list_mapped_regions(self,
+                            writeable_only: bool = True,
+                            max_region_bytes: Optional[int] = None,
+                            anonymous_only: bool = False,
+                            ) -> List[Tuple[int, int]]:
+        """
+        See `AbstractProcess.list_mapped_regions(...)`.
 
-    def list_mapped_regions(self, writeable_only: bool = True) -> List[Tuple[int, int]]:
+        Args:
+            anonymous_only: If `True`, only return regions which are not backed by a file,
+                i.e. anonymous mappings, `[heap]` and `[stack]`. Default `False`.
+        """
         regions = []
         with open('/proc/{}/maps'.format(self.pid), 'r') as maps:
             for line in maps:
-                bounds, privileges = line.split()[0:2]
+                bounds, privileges, _offset, _dev, inode, *path = line.split(maxsplit=5)
 
                 if 'r' not in privileges:
                     continue
@@ -146,6 +302,16 @@ class Process(AbstractProcess):
                 if writeable_only and 'w' not in privileges:
                     continue
 
+                if anonymous_only:
+                    name = path[0].rstrip('\n') if path else ''
+                    if inode != '0' or not _is_anonymous_region_name(name):
+                        continue
+
                 start, stop = (int(bound, 16) for bound in bounds.split('-'))
+
+                if max_region_bytes is not None and stop - start > max_region_bytes:
+                    continue
+
                 regions.append((start, stop))
         return regions
+
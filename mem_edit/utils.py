@@ -7,13 +7,47 @@ Utility functions and types:
     MemEditError
 
   Search for a buffer inside another buffer:
+    search_buffer_verbatim(needle_buffer, haystack_buffer)
     search_buffer(needle_buffer, haystack_buffer)
+  Build a reusable, specialized search function for a needle:
+    compile_needle_scanner(needle_buffer)
   Check if two buffers (ctypes objects) store equal values:
     ctypes_equal(a, b)
 """
 
-from typing import List, Union
+from typing import List, Union, Optional, Callable
 import ctypes
+import functools
+import types
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@functools.lru_cache(maxsize=None)
+def _get_numba() -> Optional[types.SimpleNamespace]:
+    """
+    Import numba and compile the search kernels with it, on first use rather than at import
+      (importing numba takes longer than the rest of mem_edit put together, and most users
+      never search with a kernel).
+
+    Returns:
+        Namespace holding the compiled `bmh_find_all` and `search_buffer` kernels, or `None`
+          if numba (or numpy) isn't installed.
+    """
+    if numpy is None:
+        return None
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    return types.SimpleNamespace(
+        bmh_find_all=numba.njit(cache=True)(_bmh_find_all),
+        search_buffer=numba.njit(cache=True)(_search_buffer_kernel),
+        )
 
 
 ctypes_buffer_t = Union[ctypes._SimpleCData, ctypes.Array, ctypes.Structure, ctypes.Union]
@@ -25,6 +59,7 @@ class MemEditError(Exception):
 
 def search_buffer_verbatim(needle_buffer: ctypes_buffer_t,
                            haystack_buffer: ctypes_buffer_t,
+                           align: int = 1,
                            ) -> List[int]:
     """
     Search for a buffer inside another buffer, using a direct (bitwise) comparison
@@ -32,26 +67,153 @@ def search_buffer_verbatim(needle_buffer: ctypes_buffer_t,
     Args:
         needle_buffer: Buffer to search for.
         haystack_buffer: Buffer to search in.
+        align: Only report offsets which are a multiple of `align`. Passing
+            `ctypes.alignment(needle_buffer)` skips the unaligned positions, which makes
+            searching for integers noticeably faster. Default 1.
 
     Returns:
         List of offsets where the `needle_buffer` was found.
     """
-    found = []
-
-    haystack = bytes(haystack_buffer)
     needle = bytes(needle_buffer)
+    if numpy is not None and len(needle) in _uint_dtypes:
+        return _compile_integer_scanner(needle, align)(haystack_buffer)
+
+    if (0 < len(needle) <= _bmh_max_needle_size
+            and memoryview(haystack_buffer).nbytes > _bmh_min_haystack_size
+            and _get_numba() is not None):
+        haystack = numpy.frombuffer(haystack_buffer, dtype=numpy.uint8)
+        found = list(_get_numba().bmh_find_all(haystack, numpy.frombuffer(needle, dtype=numpy.uint8),
+                                               _bmh_skip_table(needle)))
+    else:
+        found = []
+        haystack = bytes(haystack_buffer)
 
-    start = 0
-    result = haystack.find(needle, start)
-    while start < len(haystack) and result != -1:
-        found.append(result)
-        start = result + 1
+        start = 0
         result = haystack.find(needle, start)
+        while start < len(haystack) and result != -1:
+            found.append(result)
+            start = result + 1
+            result = haystack.find(needle, start)
+
+    if align > 1:
+        found = [offset for offset in found if offset % align == 0]
+    return found
+
+
+# numpy dtypes used to compare needles of 1, 2, 4 or 8 bytes elementwise
+_uint_dtypes = {1: 'u1', 2: 'u2', 4: 'u4', 8: 'u8'}
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_integer_scanner(needle: bytes, align: int) -> Callable[[ctypes_buffer_t], List[int]]:
+    """
+    Generate and compile a scanner for a 1, 2, 4 or 8 byte needle, with the needle's value,
+      size and the phases to compare baked in.
+
+    The scanner views the haystack (without copying it) as an array of same-sized unsigned
+      integers and compares elementwise, once per starting phase, so unaligned matches are
+      found too. If `len(needle)` is a multiple of `align`, only phases which are multiples
+      of `align` are compared; otherwise the results are filtered afterwards.
+    """
+    size = len(needle)
+    dtype = _uint_dtypes[size]
+    phases = range(0, size, align if size % align == 0 else 1)
+
+    lines = ['def scan(haystack_buffer):',
+             '    haystack = numpy.frombuffer(haystack_buffer, dtype=numpy.uint8)',
+             '    length = len(haystack)',
+             '    found = []']
+    for phase in phases:
+        lines += ['    if length > {}:'.format(phase),
+                  '        view = haystack[{0}:{0} + (length - {0}) // {1} * {1}].view({2!r})'.format(phase, size, dtype),
+                  '        found.append(numpy.flatnonzero(view == needle_value) * {} + {})'.format(size, phase)]
+    lines += ['    if not found:',
+              '        return []']
+    if len(phases) == 1:
+        lines += ['    found = found[0].tolist()']
+    else:
+        lines += ['    found = numpy.sort(numpy.concatenate(found)).tolist()']
+    if size % align != 0:
+        lines += ['    found = [offset for offset in found if offset % {} == 0]'.format(align)]
+    lines += ['    return found']
+
+    namespace = {
+        'numpy': numpy,
+        'needle_value': numpy.frombuffer(needle, dtype=dtype)[0],
+        }
+    exec('\n'.join(lines), namespace)
+    return namespace['scan']
+
+
+def compile_needle_scanner(needle_buffer: ctypes_buffer_t,
+                           align: int = 1,
+                           ) -> Callable[[ctypes_buffer_t], List[int]]:
+    """
+    Build a function `scan(haystack_buffer)` which is equivalent to
+      `search_buffer_verbatim(needle_buffer, haystack_buffer, align)`, but specialized for
+      the current value of `needle_buffer`. Useful when searching many buffers for the
+      same needle.
+
+    For needles of 1, 2, 4 or 8 bytes (when numpy is available), a dedicated scanner is
+      generated and cached, so repeated searches for the same value reuse it.
+
+    Args:
+        needle_buffer: Buffer to search for. Later changes to it don't affect the scanner.
+        align: Only report offsets which are a multiple of `align`. Default 1.
+
+    Returns:
+        Function taking a haystack buffer and returning the list of offsets where the
+          needle was found.
+    """
+    needle = bytes(needle_buffer)
+    if numpy is not None and len(needle) in _uint_dtypes:
+        return _compile_integer_scanner(needle, align)
+    needle_copy = (ctypes.c_char * len(needle)).from_buffer_copy(needle)
+    return functools.partial(search_buffer_verbatim, needle_copy, align=align)
+
+
+# Short needles in large haystacks are searched with a compiled Boyer-Moore-Horspool loop.
+#  It only beats bytes.find() on haystacks of several MiB (or dense with matches), so
+#  search_all_memory()'s 1MiB chunks stay on bytes.find().
+_bmh_max_needle_size = 16
+_bmh_min_haystack_size = 4 * 1024 * 1024
+
+
+@functools.lru_cache(maxsize=64)
+def _bmh_skip_table(needle: bytes) -> 'numpy.ndarray':
+    """
+    Build the Boyer-Moore-Horspool skip table for `needle`: for each byte value, how far
+      the search window may advance when that byte is found under the window's last position.
+    """
+    skip = numpy.full(256, len(needle), dtype=numpy.intp)
+    for i, byte in enumerate(needle[:-1]):
+        skip[byte] = len(needle) - 1 - i
+    return skip
+
+
+def _bmh_find_all(haystack, needle, skip):
+    """
+    Boyer-Moore-Horspool search, returning the offsets of all (possibly overlapping)
+      occurrences of `needle` in `haystack`. Compiled by `_get_numba()`.
+    """
+    found = []
+    last = len(needle) - 1
+    i = 0
+    while i < len(haystack) - last:
+        tail = haystack[i + last]
+        if tail == needle[last]:
+            j = 0
+            while j < last and haystack[i + j] == needle[j]:
+                j += 1
+            if j == last:
+                found.append(i)
+        i += skip[tail]
     return found
 
 
 def search_buffer(needle_buffer: ctypes_buffer_t,
                   haystack_buffer: ctypes_buffer_t,
+                  align: int = 1,
                   ) -> List[int]:
     """
     Search for a buffer inside another buffer, using `ctypes_equal` for comparison.
@@ -60,19 +222,97 @@ def search_buffer(needle_buffer: ctypes_buffer_t,
     Args:
         needle_buffer: Buffer to search for.
         haystack_buffer: Buffer to search in.
+        align: Only check offsets which are a multiple of `align`. Default 1.
 
     Returns:
         List of offsets where the needle_buffer was found.
     """
+    numba_kernels = _get_numba()
+    if numba_kernels is not None:
+        compared = _compared_byte_offsets(type(needle_buffer))
+        if compared is not None:
+            haystack = numpy.frombuffer(haystack_buffer, dtype=numpy.uint8)
+            needle = numpy.frombuffer(bytes(needle_buffer), dtype=numpy.uint8)
+            return list(numba_kernels.search_buffer(haystack, needle, compared, align))
+
     found = []
-    read_type = type(needle_buffer)
-    for offset in range(0, len(haystack_buffer) - ctypes.sizeof(needle_buffer)):
-        v = read_type.from_buffer(haystack_buffer, offset)
+    from_buffer = type(needle_buffer).from_buffer
+    end = memoryview(haystack_buffer).nbytes - ctypes.sizeof(needle_buffer) + 1
+    for offset in range(0, end, align):
+        v = from_buffer(haystack_buffer, offset)
         if ctypes_equal(needle_buffer, v):
             found.append(offset)
     return found
 
 
+# ctypes simple types whose `.value` comparison is equivalent to comparing their bytes
+_bytewise_simple_types = set('bBhHiIlLqQcuP')
+
+
+def _field_byte_offsets(ctype: type, base: int) -> Optional[List[int]]:
+    """
+    List the byte offsets (relative to the start of the outermost buffer) at which
+      `ctypes_equal` effectively compares a value of type `ctype` placed at `base`.
+      Padding bytes are left out.
+
+    Returns `None` if `ctype` contains a member which can't be compared bytewise
+      (floats, pointers to strings, bitfields, arrays of aggregates, ...).
+    """
+    if issubclass(ctype, ctypes._SimpleCData):
+        if ctype._type_ not in _bytewise_simple_types:
+            return None
+        return list(range(base, base + ctypes.sizeof(ctype)))
+
+    if issubclass(ctype, ctypes.Array):
+        element_type = ctype._type_
+        if (not issubclass(element_type, ctypes._SimpleCData)
+                or element_type._type_ not in _bytewise_simple_types):
+            return None
+        return list(range(base, base + ctypes.sizeof(ctype)))
+
+    if issubclass(ctype, (ctypes.Structure, ctypes.Union)):
+        offsets = set()
+        for field in ctype._fields_:
+            if len(field) != 2:
+                return None             # bitfield
+            name, field_type = field
+            field_offsets = _field_byte_offsets(field_type, base + getattr(ctype, name).offset)
+            if field_offsets is None:
+                return None
+            offsets.update(field_offsets)
+        return sorted(offsets)
+
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _compared_byte_offsets(ctype: type) -> Optional['numpy.ndarray']:
+    """
+    Cached array form of `_field_byte_offsets(ctype, 0)`, for use by `_search_buffer_kernel`.
+    """
+    offsets = _field_byte_offsets(ctype, 0)
+    if offsets is None:
+        return None
+    return numpy.array(offsets, dtype=numpy.intp)
+
+
+def _search_buffer_kernel(haystack, needle, compared, align):
+    """
+    Sliding-window search: report each offset `i` (a multiple of `align`) for which
+      `haystack[i + j] == needle[j]` for every `j` in `compared`. Compiled by `_get_numba()`.
+    """
+    found = []
+    for i in range(0, len(haystack) - len(needle) + 1, align):
+        match = True
+        for j in compared:
+            if haystack[i + j] != needle[j]:
+                match = False
+                break
+        if match:
+            found.append(i)
+    return found
+
+
 def ctypes_equal(a: ctypes_buffer_t,
                  b: ctypes_buffer_t,
                  ) -> bool:
@@ -2,10 +2,10 @@
 Implementation of Process class for Windows
 """
 
-from typing import List, Tuple, Optional
-from math import floor
-from os import strerror
-import os.path
+from typing import List, Tuple, Optional, Generator
+from concurrent.futures import ThreadPoolExecutor
+import struct
+import threading
 import ctypes
 import ctypes.wintypes
 import logging
@@ -20,6 +20,7 @@ logger = logging.getLogger(__name__)
 # Process handle privileges
 privileges = {
     'PROCESS_QUERY_INFORMATION': 0x0400,
+    'PROCESS_QUERY_LIMITED_INFORMATION': 0x1000,
     'PROCESS_VM_OPERATION': 0x0008,
     'PROCESS_VM_READ': 0x0010,
     'PROCESS_VM_WRITE': 0x0020,
@@ -31,6 +32,9 @@ privileges['PROCESS_RW'] = (
     privileges['PROCESS_VM_WRITE']
     )
 
+# Win32 error codes
+ERROR_INVALID_PARAMETER = 87
+
 # Memory region states
 mem_states = {
     'MEM_COMMIT': 0x1000,
@@ -91,29 +95,19 @@ class MEMORY_BASIC_INFORMATION64(ctypes.Structure):
         ('__alignment2', ctypes.wintypes.DWORD),
         ]
 
+# Decoders which unpack (RegionSize, State, Protect, Type) directly from the raw bytes
+#  of a MEMORY_BASIC_INFORMATION, skipping the fields list_mapped_regions doesn't need
+_MBI_FIELDS64 = struct.Struct('<24xQIII4x')
+_MBI_FIELDS32 = struct.Struct('<12xIIII')
+
 PTR_SIZE = ctypes.sizeof(ctypes.c_void_p)
 if PTR_SIZE == 8:       # 64-bit python
     MEMORY_BASIC_INFORMATION = MEMORY_BASIC_INFORMATION64
+    _mbi_fields = _MBI_FIELDS64
 elif PTR_SIZE == 4:     # 32-bit python
     MEMORY_BASIC_INFORMATION = MEMORY_BASIC_INFORMATION32
-
-ctypes.windll.kernel32.VirtualQueryEx.argtypes = [
-    ctypes.wintypes.HANDLE,
-    ctypes.wintypes.LPCVOID,
-    ctypes.c_void_p,
-    ctypes.c_size_t]
-ctypes.windll.kernel32.ReadProcessMemory.argtypes = [
-    ctypes.wintypes.HANDLE,
-    ctypes.wintypes.LPCVOID,
-    ctypes.c_void_p,
-    ctypes.c_size_t,
-    ctypes.c_void_p]
-ctypes.windll.kernel32.WriteProcessMemory.argtypes = [
-    ctypes.wintypes.HANDLE,
-    ctypes.wintypes.LPCVOID,
-    ctypes.c_void_p,
-    ctypes.c_size_t,
-    ctypes.c_void_p]
+    _mbi_fields = _MBI_FIELDS32
+_MBI_SIZE = ctypes.sizeof(MEMORY_BASIC_INFORMATION)
 
 # C struct for GetSystemInfo
 class SYSTEM_INFO(ctypes.Structure):
@@ -132,11 +126,125 @@ class SYSTEM_INFO(ctypes.Structure):
         ]
 
 
+# Bind the WinAPI functions we use once, with their prototypes, so calls don't go through
+#  the `ctypes.windll` attribute lookups. `use_last_error` makes ctypes capture the error
+#  code right after each call, for retrieval with `ctypes.get_last_error()`.
+kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+psapi = ctypes.WinDLL('psapi', use_last_error=True)
+ntdll = ctypes.WinDLL('ntdll')
+
+_OpenProcess = kernel32.OpenProcess
+_OpenProcess.argtypes = [
+    ctypes.wintypes.DWORD,
+    ctypes.wintypes.BOOL,
+    ctypes.wintypes.DWORD]
+_OpenProcess.restype = ctypes.wintypes.HANDLE
+
+_CloseHandle = kernel32.CloseHandle
+_CloseHandle.argtypes = [ctypes.wintypes.HANDLE]
+_CloseHandle.restype = ctypes.wintypes.BOOL
+
+# Process memory is read and written through the ntdll system call stubs which
+#  Read/WriteProcessMemory wrap, skipping kernel32's status-to-last-error translation.
+_NtReadVirtualMemory = ntdll.NtReadVirtualMemory
+_NtReadVirtualMemory.argtypes = [
+    ctypes.wintypes.HANDLE,
+    ctypes.wintypes.LPCVOID,
+    ctypes.c_void_p,
+    ctypes.c_size_t,
+    ctypes.POINTER(ctypes.c_size_t)]
+_NtReadVirtualMemory.restype = ctypes.c_long      # NTSTATUS
+
+_NtWriteVirtualMemory = ntdll.NtWriteVirtualMemory
+_NtWriteVirtualMemory.argtypes = [
+    ctypes.wintypes.HANDLE,
+    ctypes.c_void_p,
+    ctypes.c_void_p,
+    ctypes.c_size_t,
+    ctypes.POINTER(ctypes.c_size_t)]
+_NtWriteVirtualMemory.restype = ctypes.c_long     # NTSTATUS
+
+_RtlNtStatusToDosError = ntdll.RtlNtStatusToDosError
+_RtlNtStatusToDosError.argtypes = [ctypes.wintypes.ULONG]
+_RtlNtStatusToDosError.restype = ctypes.wintypes.ULONG
+
+_VirtualQueryEx = kernel32.VirtualQueryEx
+_VirtualQueryEx.argtypes = [
+    ctypes.wintypes.HANDLE,
+    ctypes.wintypes.LPCVOID,
+    ctypes.c_void_p,
+    ctypes.c_size_t]
+_VirtualQueryEx.restype = ctypes.c_size_t
+
+_GetSystemInfo = kernel32.GetSystemInfo
+_GetSystemInfo.argtypes = [ctypes.POINTER(SYSTEM_INFO)]
+_GetSystemInfo.restype = None
+
+_QueryFullProcessImageNameW = kernel32.QueryFullProcessImageNameW
+_QueryFullProcessImageNameW.argtypes = [
+    ctypes.wintypes.HANDLE,
+    ctypes.wintypes.DWORD,
+    ctypes.wintypes.LPWSTR,
+    ctypes.POINTER(ctypes.wintypes.DWORD)]
+_QueryFullProcessImageNameW.restype = ctypes.wintypes.BOOL
+
+_EnumProcesses = psapi.EnumProcesses
+_EnumProcesses.argtypes = [
+    ctypes.c_void_p,
+    ctypes.wintypes.DWORD,
+    ctypes.POINTER(ctypes.wintypes.DWORD)]
+_EnumProcesses.restype = ctypes.wintypes.BOOL
+
+
+def _check_ntstatus(status: int):
+    """
+    Raise `OSError` (with the equivalent Win32 error code) if `status` is an NTSTATUS
+      warning or error code.
+    """
+    if status < 0:
+        raise ctypes.WinError(_RtlNtStatusToDosError(status & 0xffffffff))
+
+
+# Optional C extension (see _winmem.c) which calls Read/WriteProcessMemory without the
+#  ctypes call overhead. Without it, fall back to the ctypes bindings above.
+try:
+    from ._winmem import read as _read_into, write as _write_from
+except ImportError:
+    def _read_into(handle: int, address: int, buffer: ctypes_buffer_t, size: int):
+        _check_ntstatus(_NtReadVirtualMemory(handle, address, ctypes.addressof(buffer), size, None))
+
+    def _write_from(handle: int, address: int, buffer: ctypes_buffer_t, size: int):
+        _check_ntstatus(_NtWriteVirtualMemory(handle, address, ctypes.addressof(buffer), size, None))
+
+_system_info = None
+
+
+def _get_system_info() -> SYSTEM_INFO:
+    """
+    Return the (cached) result of GetSystemInfo, which doesn't change while we're running.
+    """
+    global _system_info
+    if _system_info is None:
+        system_info = SYSTEM_INFO()
+        _GetSystemInfo(ctypes.byref(system_info))
+        _system_info = system_info
+    return _system_info
+
+
+# Longest path the W (unicode) APIs accept, and per-thread output buffers for get_path
+MAX_PATH_LEN = 32768
+_name_buffers = threading.local()
+
+# Reusable output buffer for EnumProcesses (see Process.list_available_pids)
+_pids_bytes = bytearray(100 * ctypes.sizeof(ctypes.wintypes.DWORD))
+_pids_lock = threading.Lock()
+
+
 class Process(AbstractProcess):
     process_handle = None
 
     def __init__(self, process_id: int):
-        process_handle = ctypes.windll.kernel32.OpenProcess(
+        process_handle = _OpenProcess(
             privileges['PROCESS_RW'],
             False,
             process_id
@@ -146,26 +254,26 @@ class Process(AbstractProcess):
             raise MemEditError('Couldn\'t open process {}'.format(process_id))
 
         self.process_handle = process_handle
+        self._scratch = threading.local()
 
     def close(self):
-        ctypes.windll.kernel32.CloseHandle(self.process_handle)
+        _CloseHandle(self.process_handle)
         self.process_handle = None
 
     def write_memory(self, base_address: int, write_buffer: ctypes_buffer_t):
         try:
-            ctypes.windll.kernel32.WriteProcessMemory(
+            _write_from(
                 self.process_handle,
                 base_address,
-                ctypes.byref(write_buffer),
+                write_buffer,
                 ctypes.sizeof(write_buffer),
-                None
                 )
         except (BufferError, ValueError, TypeError):
             raise MemEditError('Error with handle {}:  {}'.format(self.process_handle, self._get_last_error()))
 
     def write_memory_pointer(self, base_address: int, write_pointer: ctypes_buffer_t, size: int):
         try:
-            ctypes.windll.kernel32.WriteProcessMemory(
+            status = _NtWriteVirtualMemory(
                 self.process_handle,
                 base_address,
                 write_pointer,
@@ -174,150 +282,298 @@ class Process(AbstractProcess):
                 )
         except (BufferError, ValueError, TypeError):
             raise MemEditError('Error with handle {}:  {}'.format(self.process_handle, self._get_last_error()))
+        _check_ntstatus(status)
 
     def read_memory(self, base_address: int, read_buffer: ctypes_buffer_t) -> ctypes_buffer_t:
         try:
-            ctypes.windll.kernel32.ReadProcessMemory(
+            _read_into(
                 self.process_handle,
                 base_address,
-                ctypes.byref(read_buffer),
+                read_buffer,
                 ctypes.sizeof(read_buffer),
-                None
                 )
         except (BufferError, ValueError, TypeError):
             raise MemEditError('Error with handle {}: {}'.format(self.process_handle, self._get_last_error()))
 
         return read_buffer
 
+    def read_region(self, base_address: int, size: int) -> memoryview:
+        """
+        Read `size` bytes starting at `base_address` into a scratch buffer owned by this
+          Process, and return a view of them. The scratch buffer is reused across calls and
+          grown geometrically, so reading many regions doesn't allocate a buffer per region.
+          Each thread gets its own scratch buffer.
+
+        The returned view is only valid until the next call to `read_region(...)` from the
+          same thread; copy it (e.g. with `bytes(...)`) if you need to keep the data.
+
+        Args:
+            base_address: The address to read from, in the process's address space.
+            size: Number of bytes to read.
+
+        Returns:
+            `memoryview` of the `size` bytes which were read.
+        """
+        scratch, scratch_buffer = self._get_scratch(size)
+        self._read_scratch(base_address, scratch_buffer, size)
+        return memoryview(scratch)[:size]
+
+    def read_bytes(self, base_address: int, size: int) -> bytes:
+        # Read through the scratch buffer, then copy out with a single memcpy
+        _scratch, scratch_buffer = self._get_scratch(size)
+        self._read_scratch(base_address, scratch_buffer, size)
+        return ctypes.string_at(scratch_buffer, size)
+
+    def _get_scratch(self, size: int) -> Tuple[bytearray, ctypes.Array]:
+        """
+        Return the calling thread's scratch `bytearray` and a ctypes view of it, growing
+          them if they hold fewer than `size` bytes.
+        """
+        local = self._scratch
+        scratch = getattr(local, 'scratch', None)
+        if scratch is None or len(scratch) < size:
+            scratch = bytearray(max(size, 2 * len(scratch or b'')))
+            local.scratch = scratch
+            local.scratch_buffer = (ctypes.c_char * len(scratch)).from_buffer(scratch)
+        return scratch, local.scratch_buffer
+
+    def _read_scratch(self, base_address: int, scratch_buffer: ctypes.Array, size: int):
+        try:
+            _read_into(
+                self.process_handle,
+                base_address,
+                scratch_buffer,
+                size,
+                )
+        except (BufferError, ValueError, TypeError):
+            raise MemEditError('Error with handle {}: {}'.format(self.process_handle, self._get_last_error()))
+
     @staticmethod
     def _get_last_error() -> Tuple[int, str]:
-        err = ctypes.windll.kernel32.GetLastError()
-        return err, strerror(err)
+        err = ctypes.get_last_error()
+        return err, ctypes.FormatError(err)
 
     def get_path(self) -> str:
-        max_path_len = 260
-        name_buffer = (ctypes.c_char * max_path_len)()
-        rval = ctypes.windll.psapi.GetProcessImageFileNameA(
-             self.process_handle,
-             name_buffer,
-             max_path_len)
-
-        if rval > 0:
-            return name_buffer.value.decode()
+        return self._path_from_handle(self.process_handle)
+
+    @staticmethod
+    def _open_for_query(pid: int) -> Optional[int]:
+        """
+        Open process `pid` with only PROCESS_QUERY_LIMITED_INFORMATION access, which is enough
+          to query its executable path and is granted for far more processes (including
+          protected ones) than PROCESS_RW.
+
+        Returns:
+            The process handle, which must be closed with `_CloseHandle(...)`, or `None` if the
+              process couldn't be opened.
+        """
+        return _OpenProcess(privileges['PROCESS_QUERY_LIMITED_INFORMATION'], False, pid)
+
+    @staticmethod
+    def _path_from_handle(process_handle: int) -> Optional[str]:
+        """
+        Return the path to the executable of the process with handle `process_handle`,
+          or `None` if it can't be queried.
+        """
+        # Reuse a per-thread buffer (pid lookups call this from several threads at once)
+        #  instead of allocating and zeroing 64KiB on every call
+        name_buffer = getattr(_name_buffers, 'buffer', None)
+        if name_buffer is None:
+            name_buffer = (ctypes.c_wchar * MAX_PATH_LEN)()
+            _name_buffers.buffer = name_buffer
+        name_len = ctypes.wintypes.DWORD(MAX_PATH_LEN)
+        success = _QueryFullProcessImageNameW(
+            process_handle,
+            0,
+            name_buffer,
+            ctypes.byref(name_len))
+
+        if success:
+            return name_buffer[:name_len.value]
         else:
             return None
 
     @staticmethod
     def list_available_pids() -> List[int]:
         # According to EnumProcesses docs, you can't find out how many processes there are before
-        #  fetching the list. As a result, we grab 100 on the first try, and if we get a full list
-        #  of 100, repeatedly double the number until we get fewer than we asked for.
+        #  fetching the list. As a result, we start with room for 100, and if we get a full list,
+        #  repeatedly double the capacity until we get fewer than we asked for. The buffer is kept
+        #  between calls, so after the first call it's usually already big enough.
+        global _pids_bytes
 
-        n = 100
         returned_size = ctypes.wintypes.DWORD()
         returned_size_ptr = ctypes.byref(returned_size)
 
-        while True:
-            pids = (ctypes.wintypes.DWORD * n)()
-            size = ctypes.sizeof(pids)
-            pids_ptr = ctypes.byref(pids)
+        with _pids_lock:
+            while True:
+                n = len(_pids_bytes) // ctypes.sizeof(ctypes.wintypes.DWORD)
+                pids = (ctypes.wintypes.DWORD * n).from_buffer(_pids_bytes)
+                size = ctypes.sizeof(pids)
 
-            success = ctypes.windll.Psapi.EnumProcesses(pids_ptr, size, returned_size_ptr)
-            if not success:
-                raise MemEditError('Failed to enumerate processes: n={}'.format(n))
+                success = _EnumProcesses(ctypes.addressof(pids), size, returned_size_ptr)
+                if not success:
+                    raise MemEditError('Failed to enumerate processes: n={}'.format(n))
 
-            num_returned = floor(returned_size.value / ctypes.sizeof(ctypes.wintypes.DWORD))
+                num_returned = returned_size.value >> 2     # sizeof(DWORD) == 4
 
-            if n == num_returned:
-                n *= 2
-                continue
-            else:
-                break
+                if n == num_returned:
+                    _pids_bytes = bytearray(2 * len(_pids_bytes))
+                    continue
+                else:
+                    break
 
-        return pids[:num_returned]
+            return pids[:num_returned]
 
     @staticmethod
     def get_pid_by_name(target_name: str) -> Optional[int]:
-        for pid in Process.list_available_pids():
-            try:
-                logger.debug('Checking name for pid {}'.format(pid))
-                with Process.open_process(pid) as process:
-                    path = process.get_path()
-
-                name = os.path.basename(path)
-                logger.debug('Name was "{}"'.format(name))
-                if path is not None and name == target_name:
-                    return pid
-            except ValueError:
-                pass
-            except MemEditError as err:
-                logger.debug(repr(err))
-
-        logger.info('Found no process with name {}'.format(target_name))
-        return None
+        pid = next(Process._iter_pids_by_name(target_name), None)
+        if pid is None:
+            logger.info('Found no process with name {}'.format(target_name))
+        return pid
+
+    @staticmethod
+    def get_pids_by_name(target_name: str) -> List[int]:
+        return list(Process._iter_pids_by_name(target_name))
 
     @staticmethod
-    def get_pids_by_name(target_name: str) -> Optional[int]:
-        pids = []
-        for pid in Process.list_available_pids():
-            try:
-                logger.debug('Checking name for pid {}'.format(pid))
-                with Process.open_process(pid) as process:
-                    path = process.get_path()
-
-                name = os.path.basename(path)
-                logger.debug('Name was "{}"'.format(name))
-                if path is not None and name == target_name:
-                    pids.append(pid)
-            except ValueError:
-                pass
-            except MemEditError as err:
-                logger.debug(repr(err))
-
-        #logger.info('Found no process with name {}'.format(target_name))
-        return pids
-
-    def list_mapped_regions(self, writeable_only: bool = True) -> List[Tuple[int, int]]:
-        sys_info = SYSTEM_INFO()
-        sys_info_ptr = ctypes.byref(sys_info)
-        ctypes.windll.kernel32.GetSystemInfo(sys_info_ptr)
+    def _iter_pids_by_name(target_name: str) -> Generator[int, None, None]:
+        """
+        Yield the pid of each process whose executable file is named `target_name`
+          (compared case-insensitively).
+
+        Opening and querying each process is almost entirely time spent blocked in the
+          kernel, so the processes are probed concurrently from a pool of threads.
+        """
+        # Windows file names are case-insensitive. Matching on a path-separator-prefixed suffix
+        #  is equivalent to comparing basenames, without splitting every path.
+        target_name = target_name.lower()
+        suffixes = ('\\' + target_name, '/' + target_name)
+
+        pids = Process.list_available_pids()
+        executor = ThreadPoolExecutor(max_workers=32)
+        try:
+            for pid, path in zip(pids, executor.map(Process._probe_path, pids)):
+                if path is None:
+                    continue
+
+                logger.debug('Path was "{}"'.format(path))
+                path = path.lower()
+                if path.endswith(suffixes) or path == target_name:
+                    yield pid
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    @staticmethod
+    def _probe_path(pid: int) -> Optional[str]:
+        """
+        Return the path to the executable of process `pid`, or `None` if the process
+          can't be opened or queried.
+        """
+        logger.debug('Checking name for pid {}'.format(pid))
+        process_handle = Process._open_for_query(pid)
+        if not process_handle:
+            logger.debug('Couldn\'t open process {}: {}'.format(pid, Process._get_last_error()))
+            return None
 
+        try:
+            path = Process._path_from_handle(process_handle)
+            if path is None:
+                logger.debug('Couldn\'t query path of process {}: {}'.format(pid, Process._get_last_error()))
+            return path
+        finally:
+            _CloseHandle(process_handle)
+
+    def list_mapped_regions(self,
+                            writeable_only: bool = True,
+                            max_region_bytes: Optional[int] = None,
+                            anonymous_only: bool = False,
+                            ) -> List[Tuple[int, int]]:
+        """
+        See `AbstractProcess.list_mapped_regions(...)`.
+
+        Only private (MEM_PRIVATE) memory is ever listed, which is never backed by a file,
+          so `anonymous_only` has no further effect here.
+        """
+        sys_info = _get_system_info()
         start = sys_info.lpMinimumApplicationAddress
         stop = sys_info.lpMaximumApplicationAddress
+        page_size = sys_info.dwPageSize
+
+        # A single MEMORY_BASIC_INFORMATION buffer is filled in by every query, so walking the
+        #  address space doesn't allocate a new struct per region. The fields we need are
+        #  decoded with one struct.unpack_from call rather than a ctypes getter per field.
+        #  Everything get_mem_info touches per call is bound here, so each query costs no
+        #  attribute or global lookups.
+        mbi_size = _MBI_SIZE
+        mbi_bytes = bytearray(mbi_size)
+        mbi_ptr = (ctypes.c_char * mbi_size).from_buffer(mbi_bytes)
+        unpack_mbi = _mbi_fields.unpack_from
+        virtual_query_ex = _VirtualQueryEx
+        process_handle = self.process_handle
 
         def get_mem_info(address):
             """
             Query the memory region starting at or before 'address' to get its size/type/state/permissions.
+            Returns a (region_size, state, protect, type) tuple, or None if 'address' is past
+            the end of the address space.
             """
-            mbi = MEMORY_BASIC_INFORMATION()
-            mbi_ptr = ctypes.byref(mbi)
-            mbi_size = ctypes.sizeof(mbi)
-
-            success = ctypes.windll.kernel32.VirtualQueryEx(
-                self.process_handle,
+            success = virtual_query_ex(
+                process_handle,
                 address,
                 mbi_ptr,
                 mbi_size)
 
             if success != mbi_size:
                 if success == 0:
+                    err = self._get_last_error()
+                    if err[0] == ERROR_INVALID_PARAMETER:
+                        # Ran off the end of the process's address space
+                        return None
                     raise MemEditError('Failed VirtualQueryEx with handle ' +
-                                       '{}: {}'.format(self.process_handle, self._get_last_error()))
+                                       '{}: {}'.format(process_handle, err))
                 else:
                     raise MemEditError('VirtualQueryEx output too short!')
 
-            return mbi
+            return unpack_mbi(mbi_bytes)
+
+        # Bind the constants used in the loop condition once, rather than looking them up
+        #  for every region
+        mem_private = mem_types['MEM_PRIVATE']
+        mem_commit = mem_states['MEM_COMMIT']
+        page_readable = page_protections['PAGE_READABLE']
+        page_readwriteable = page_protections['PAGE_READWRITEABLE']
 
         regions = []
         page_ptr = start
         while page_ptr < stop:
             page_info = get_mem_info(page_ptr)
-            if (page_info.Type == mem_types['MEM_PRIVATE']
-                    and page_info.State == mem_states['MEM_COMMIT']
-                    and page_info.Protect & page_protections['PAGE_READABLE'] != 0
-                    and (page_info.Protect & page_protections['PAGE_READWRITEABLE'] != 0
-                         or not writeable_only)):
-                regions.append((page_ptr, page_ptr + page_info.RegionSize))
-            page_ptr += page_info.RegionSize
+            if page_info is None:
+                break
+
+            region_size, state, protect, mem_type = page_info
+            if region_size == 0:
+                # Shouldn't happen, but has been seen under WOW64; step over the page so we
+                #  don't query the same address forever
+                page_ptr += page_size
+                continue
+
+            if (mem_type == mem_private
+                    and state == mem_commit
+                    and protect & page_readable != 0
+                    and (protect & page_readwriteable != 0
+                         or not writeable_only)
+                    and (max_region_bytes is None
+                         or region_size <= max_region_bytes)):
+                region_end = page_ptr + region_size
+                # VirtualQueryEx splits the address space wherever the attributes change, even
+                #  between regions which both pass the filter. Merge such contiguous regions so
+                #  callers issue fewer, larger reads (as long as the result isn't too large).
+                if (regions and regions[-1][1] == page_ptr
+                        and (max_region_bytes is None
+                             or region_end - regions[-1][0] <= max_region_bytes)):
+                    regions[-1] = (regions[-1][0], region_end)
+                else:
+                    regions.append((page_ptr, region_end))
+            page_ptr += region_size
 
         return regions
@@ -0,0 +1,179 @@
+"""
+Tests for the platform-independent searching and reading in mem_edit.abstract.Process, run against
+  an in-memory stand-in for a process
+"""
+
+import ctypes
+import random
+import unittest
+from typing import List, Tuple, Optional
+
+from mem_edit.abstract import Process as AbstractProcess
+from mem_edit.utils import ctypes_buffer_t
+
+from test_utils import find_all, make_haystack
+
+
+class BufferProcess(AbstractProcess):
+    """
+    "Process" whose address space is a single bytes object starting at `base_address`,
+      mapped as the given `(start, stop)` regions.
+    """
+    def __init__(self, memory: bytes, base_address: int, regions: List[Tuple[int, int]]):
+        self.memory = memory
+        self.base_address = base_address
+        self.regions = regions
+
+    def close(self):
+        pass
+
+    def write_memory(self, base_address: int, write_buffer: ctypes_buffer_t):
+        raise NotImplementedError
+
+    def write_memory_pointer(self, base_address: int, write_pointer: ctypes_buffer_t, size: int):
+        raise NotImplementedError
+
+    def read_memory(self, base_address: int, read_buffer: ctypes_buffer_t) -> ctypes_buffer_t:
+        offset = base_address - self.base_address
+        size = ctypes.sizeof(read_buffer)
+        if offset < 0 or offset + size > len(self.memory):
+            raise OSError('read outside of memory')
+        ctypes.memmove(ctypes.addressof(read_buffer), self.memory[offset:offset + size], size)
+        return read_buffer
+
+    def list_mapped_regions(self,
+                            writeable_only: bool = True,
+                            max_region_bytes: Optional[int] = None,
+                            anonymous_only: bool = False,
+                            ) -> List[Tuple[int, int]]:
+        return [(start, stop) for start, stop in self.regions
+                if max_region_bytes is None or stop - start <= max_region_bytes]
+
+    def get_path(self) -> str:
+        return ''
+
+    @staticmethod
+    def list_available_pids() -> List[int]:
+        return []
+
+    @staticmethod
+    def get_pid_by_name(target_name: str) -> Optional[int]:
+        return None
+
+
+class SearchAllMemoryTest(unittest.TestCase):
+    base_address = 0x10000
+
+    def make_process(self, rng: random.Random, needle: bytes, region_sizes: List[int]) -> BufferProcess:
+        """
+        Process with regions of the given sizes, separated by unmapped gaps of odd sizes
+          (so regions start at unaligned addresses too).
+        """
+        regions = []
+        address = self.base_address
+        for size in region_sizes:
+            address += rng.randrange(1, 40)
+            regions.append((address, address + size))
+            address += size
+        memory = make_haystack(rng, address - self.base_address, needle)
+        process = BufferProcess(memory, self.base_address, regions)
+        process.search_chunk_size = 64       # many chunk boundaries
+        return process
+
+    def expected(self, process: BufferProcess, needle: bytes, align: int) -> List[int]:
+        found = []
+        for start, stop in process.regions:
+            contents = process.memory[start - process.base_address:stop - process.base_address]
+            found += [start + offset for offset in find_all(needle, contents)
+                      if (start + offset) % align == 0]
+        return found
+
+    def test_matches_reference(self):
+        rng = random.Random(2468)
+        needles = [ctypes.c_uint8(3), ctypes.c_int16(0x0301), ctypes.c_int32(0x03010203),
+                   (ctypes.c_uint8 * 3)(3, 1, 2), (ctypes.c_uint8 * 11)(*range(11))]
+        for needle in needles:
+            process = self.make_process(rng, bytes(needle), [0, 5, 100, 1000, 3000])
+            for align in (1, 2, 3, 4, 8, 100):
+                for verbatim in (True, False):
+                    for parallel in (False, True):
+                        with self.subTest(needle=type(needle).__name__, align=align,
+                                          verbatim=verbatim, parallel=parallel):
+                            found = process.search_all_memory(needle, verbatim=verbatim, parallel=parallel,
+                                                              align=align)
+                            self.assertEqual(sorted(found), self.expected(process, bytes(needle), align))
+
+    def test_align_larger_than_chunk(self):
+        rng = random.Random(1357)
+        needle = ctypes.c_uint8(3)
+        process = self.make_process(rng, bytes(needle), [5000])
+        for align in (process.search_chunk_size + 1, 128, 1024):
+            with self.subTest(align=align):
+                found = process.search_all_memory(needle, align=align)
+                self.assertEqual(found, self.expected(process, bytes(needle), align))
+
+    def test_invalid_align(self):
+        process = self.make_process(random.Random(0), b'\x03', [100])
+        for align in (0, -1):
+            with self.subTest(align=align):
+                with self.assertRaises(ValueError):
+                    process.search_all_memory(ctypes.c_uint8(3), align=align)
+
+
+class SearchAddressesTest(unittest.TestCase):
+    base_address = 0x10000
+
+    def test_matches_reference(self):
+        rng = random.Random(8642)
+        needles = [ctypes.c_uint8(3), ctypes.c_int16(0x0301), ctypes.c_int32(0x03010203),
+                   ctypes.c_double(1.5), (ctypes.c_uint8 * 5)(3, 1, 2, 3, 1)]
+        for needle in needles:
+            memory = make_haystack(rng, 3000, bytes(needle))
+            process = BufferProcess(memory, self.base_address,
+                                    [(self.base_address, self.base_address + len(memory))])
+            addresses = [self.base_address + offset
+                         for offset in rng.sample(range(len(memory) - ctypes.sizeof(needle) + 1), 1000)]
+            matches = {self.base_address + offset for offset in find_all(bytes(needle), memory)}
+            addresses += sorted(matches)[:10]
+            for verbatim in (True, False):
+                with self.subTest(needle=type(needle).__name__, verbatim=verbatim):
+                    found = process.search_addresses(addresses, needle, verbatim=verbatim)
+                    self.assertEqual(found, [address for address in addresses if address in matches])
+                    self.assertTrue(found)
+
+    def test_needle_unchanged(self):
+        memory = bytes(range(16))
+        process = BufferProcess(memory, self.base_address, [(self.base_address, self.base_address + 16)])
+        needle = ctypes.c_int32(0x07060504)
+        for verbatim in (True, False):
+            with self.subTest(verbatim=verbatim):
+                found = process.search_addresses(range(self.base_address, self.base_address + 13), needle,
+                                                 verbatim=verbatim)
+                self.assertEqual(found, [self.base_address + 4])
+                self.assertEqual(needle.value, 0x07060504)
+
+
+class ReadRegionsTest(unittest.TestCase):
+    base_address = 0x10000
+
+    def setUp(self):
+        rng = random.Random(97)
+        self.memory = bytes(rng.randrange(256) for _ in range(10000))
+        self.process = BufferProcess(self.memory, self.base_address,
+                                     [(self.base_address, self.base_address + len(self.memory))])
+        self.regions = [(self.base_address + rng.randrange(9000), rng.randrange(1000)) for _ in range(50)]
+        self.regions.append((self.base_address, 0))
+
+    def test_read_regions(self):
+        expected = [self.memory[address - self.base_address:address - self.base_address + size]
+                    for address, size in self.regions]
+        self.assertEqual(self.process.read_regions(self.regions), expected)
+        self.assertEqual(self.process.read_regions([]), [])
+
+    def test_read_failure(self):
+        with self.assertRaises(OSError):
+            self.process.read_regions(self.regions + [(self.base_address + len(self.memory), 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,326 @@
+"""
+Tests for the Linux Process implementation
+"""
+
+import ctypes
+import ctypes.util
+import mmap
+import os
+import platform
+import select
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from typing import Optional
+
+if platform.system() == 'Linux':
+    from mem_edit import linux
+
+
+_libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+_libc.mmap.argtypes = (ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long)
+_libc.mmap.restype = ctypes.c_void_p
+_libc.munmap.argtypes = (ctypes.c_void_p, ctypes.c_size_t)
+_libc.munmap.restype = ctypes.c_int
+
+
+@unittest.skipUnless(platform.system() == 'Linux', 'Linux only')
+class ListMappedRegionsTest(unittest.TestCase):
+    size = 16 * mmap.PAGESIZE
+
+    def setUp(self):
+        # list_mapped_regions() only reads /proc/<pid>/maps, so it can be pointed at this
+        #  process without attaching to it (which a process can't do to itself)
+        self.process = linux.Process.__new__(linux.Process)
+        self.process.pid = os.getpid()
+
+    def map(self, prot: int, flags: int, fd: int = -1) -> int:
+        address = _libc.mmap(None, self.size, prot, flags, fd, 0)
+        if address in (None, ctypes.c_void_p(-1).value):
+            raise OSError(ctypes.get_errno(), 'mmap failed')
+        self.addCleanup(_libc.munmap, address, self.size)
+        return address
+
+    def map_anonymous(self, prot: int = mmap.PROT_READ | mmap.PROT_WRITE) -> int:
+        return self.map(prot, mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS)
+
+    def map_file(self) -> int:
+        with tempfile.TemporaryFile() as backing:
+            backing.truncate(self.size)
+            return self.map(mmap.PROT_READ | mmap.PROT_WRITE, mmap.MAP_SHARED, backing.fileno())
+
+    def is_listed(self, address: int, **kwargs) -> bool:
+        regions = self.process.list_mapped_regions(**kwargs)
+        return any(start <= address and address + self.size <= stop for start, stop in regions)
+
+    def test_anonymous_region(self):
+        address = self.map_anonymous()
+        self.assertTrue(self.is_listed(address))
+        self.assertTrue(self.is_listed(address, anonymous_only=True))
+
+    def test_file_backed_region(self):
+        address = self.map_file()
+        self.assertTrue(self.is_listed(address))
+        self.assertFalse(self.is_listed(address, anonymous_only=True))
+
+    def test_read_only_region(self):
+        address = self.map_anonymous(mmap.PROT_READ)
+        self.assertFalse(self.is_listed(address))
+        self.assertTrue(self.is_listed(address, writeable_only=False))
+
+    def test_unreadable_region(self):
+        address = self.map_anonymous(0)      # PROT_NONE
+        self.assertFalse(self.is_listed(address, writeable_only=False))
+
+    def test_max_region_bytes(self):
+        address = self.map_anonymous()
+        self.assertTrue(self.is_listed(address, max_region_bytes=None))
+        self.assertFalse(self.is_listed(address, max_region_bytes=self.size - 1))
+
+
+@unittest.skipUnless(platform.system() == 'Linux', 'Linux only')
+class ReadOwnMemoryTest(unittest.TestCase):
+    def setUp(self):
+        # A process may read its own /proc/<pid>/mem without attaching to itself
+        self.process = linux.Process.__new__(linux.Process)
+        self.process.pid = os.getpid()
+        self.process.mem_fd = os.open('/proc/self/mem', os.O_RDONLY)
+        self.addCleanup(os.close, self.process.mem_fd)
+
+        # Two pages, the second of which is unmapped again
+        self.address = _libc.mmap(None, 2 * mmap.PAGESIZE, mmap.PROT_READ | mmap.PROT_WRITE,
+                                  mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS, -1, 0)
+        self.addCleanup(_libc.munmap, self.address, mmap.PAGESIZE)
+        _libc.munmap(self.address + mmap.PAGESIZE, mmap.PAGESIZE)
+        ctypes.memset(self.address, 0x5a, mmap.PAGESIZE)
+
+    def test_read_memory(self):
+        buffer = (ctypes.c_uint8 * 16)()
+        self.process.read_memory(self.address + 8, buffer)
+        self.assertEqual(bytes(buffer), b'\x5a' * 16)
+
+    def test_read_bytes(self):
+        self.assertEqual(self.process.read_bytes(self.address + 8, 16), b'\x5a' * 16)
+        self.assertEqual(self.process.read_bytes(self.address, 0), b'')
+
+    def test_short_read_bytes_raises(self):
+        with self.assertRaises(OSError):
+            self.process.read_bytes(self.address + mmap.PAGESIZE - 16, 32)
+
+    def test_short_read_memory_raises(self):
+        # Previous contents must not be mistaken for memory which couldn't be read
+        buffer = (ctypes.c_uint8 * 32)()
+        with self.assertRaises(OSError):
+            self.process.read_memory(self.address + mmap.PAGESIZE - 16, buffer)
+
+
+@unittest.skipUnless(platform.system() == 'Linux', 'Linux only')
+class PidsByNameTest(unittest.TestCase):
+    def setUp(self):
+        # Run python through a uniquely named symlink, so the name it was invoked as (in
+        #  /proc/<pid>/cmdline) differs from the file /proc/<pid>/exe resolves to
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.executable = os.path.realpath(sys.executable)
+        self.alias = 'pywebmem-test-{}'.format(os.getpid())
+        alias_path = os.path.join(directory.name, self.alias)
+        os.symlink(self.executable, alias_path)
+
+        self.child = subprocess.Popen([alias_path, '-c', 'import sys; sys.stdin.read()'],
+                                      stdin=subprocess.PIPE)
+        self.addCleanup(self.child.wait)
+        self.addCleanup(self.child.stdin.close)
+
+    def test_invoked_name(self):
+        self.assertIn(self.child.pid, linux.Process.get_pids_by_name(self.alias))
+        self.assertEqual(linux.Process.get_pid_by_name(self.alias), self.child.pid)
+
+    def test_executable_name(self):
+        self.assertIn(self.child.pid, linux.Process.get_pids_by_name(os.path.basename(self.executable)))
+
+    def test_no_match(self):
+        self.assertNotIn(self.child.pid, linux.Process.get_pids_by_name(self.alias + '-other'))
+        self.assertIsNone(linux.Process.get_pid_by_name(self.alias + '-other'))
+
+
+# Child process which exits with status 0 when it receives SIGUSR1
+_signal_waiter = '''
+import signal, sys, time
+signal.signal(signal.SIGUSR1, lambda signum, frame: sys.exit(0))
+print('ready', flush=True)
+while True:
+    time.sleep(0.01)
+'''
+
+
+@unittest.skipUnless(platform.system() == 'Linux', 'Linux only')
+class AttachedChildTest(unittest.TestCase):
+    """
+    Base for tests run against an attached child process running `script`.
+    """
+    script = _signal_waiter
+
+    def setUp(self):
+        self.child = subprocess.Popen([sys.executable, '-c', self.script], stdout=subprocess.PIPE)
+        self.addCleanup(self.child.stdout.close)
+        self.addCleanup(self.child.kill)
+        self.ready_line = self.child.stdout.readline().decode().split()
+        try:
+            self.process = linux.Process(self.child.pid)
+        except (linux.MemEditError, PermissionError) as err:
+            self.skipTest('Not allowed to attach to child process: {}'.format(err))
+
+    def assert_child_handles_sigusr1(self):
+        self.assertEqual(self.child.wait(timeout=5), 0)
+
+
+class CloseTest(AttachedChildTest):
+    def test_detached_process_keeps_running(self):
+        self.process.close()
+        os.kill(self.child.pid, signal.SIGUSR1)
+        self.assert_child_handles_sigusr1()
+
+    def test_signal_received_while_attached_is_delivered(self):
+        # Leaves the (attached) child in a signal-delivery-stop until we detach
+        os.kill(self.child.pid, signal.SIGUSR1)
+        time.sleep(0.1)
+        self.process.close()
+        self.assert_child_handles_sigusr1()
+
+
+
+# Child process which prints the name of each signal it handles
+_signal_reporter = '''
+import signal, sys, time
+for signum in (signal.SIGUSR1, signal.SIGUSR2):
+    signal.signal(signum, lambda signum, frame: print(signal.Signals(signum).name, flush=True))
+print('ready', flush=True)
+while True:
+    time.sleep(0.01)
+'''
+
+
+class ServiceStopsTest(AttachedChildTest):
+    # The child is our tracee as well as our child, so waiting on it (e.g. with Popen.poll())
+    #  would swallow the stops service_stops() is meant to handle; it reports on stdout instead.
+    script = _signal_reporter
+
+    def service_for(self, duration: float) -> Optional[str]:
+        """
+        Call `service_stops()` repeatedly for up to `duration` seconds, returning the first
+          line the child prints in that time (or None).
+        """
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            self.process.service_stops()
+            if select.select([self.child.stdout], [], [], 0.01)[0]:
+                return self.child.stdout.readline().decode().strip()
+        return None
+
+    def test_signal_is_delivered_while_attached(self):
+        os.kill(self.child.pid, signal.SIGUSR1)
+        self.assertEqual(self.service_for(5), 'SIGUSR1')
+        os.kill(self.child.pid, signal.SIGUSR2)
+        self.assertEqual(self.service_for(5), 'SIGUSR2')
+
+    def test_nothing_to_service(self):
+        self.assertIsNone(self.service_for(0.1))
+        self.process.close()
+        os.kill(self.child.pid, signal.SIGUSR1)
+        self.assertEqual(self.child.stdout.readline(), b'SIGUSR1\n')
+
+    def test_stop_and_continue(self):
+        os.kill(self.child.pid, signal.SIGSTOP)
+        self.assertIsNone(self.service_for(0.1))
+        # A stopped process only handles other signals once it's continued
+        os.kill(self.child.pid, signal.SIGUSR1)
+        self.assertIsNone(self.service_for(0.3))
+        os.kill(self.child.pid, signal.SIGCONT)
+        self.assertEqual(self.service_for(5), 'SIGUSR1')
+
+    def test_close_after_servicing(self):
+        os.kill(self.child.pid, signal.SIGUSR1)
+        self.assertEqual(self.service_for(5), 'SIGUSR1')
+        self.process.close()
+        os.kill(self.child.pid, signal.SIGUSR2)
+        self.assertEqual(self.child.stdout.readline(), b'SIGUSR2\n')
+
+
+
+# Child process with two pages of zeros, the second of them read-only, at a printed address
+_two_page_mapper = '''
+import ctypes, mmap, time
+libc = ctypes.CDLL(None, use_errno=True)
+libc.mprotect.argtypes = (ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int)
+pages = mmap.mmap(-1, 2 * mmap.PAGESIZE)
+address = ctypes.addressof(ctypes.c_char.from_buffer(pages))
+if libc.mprotect(address + mmap.PAGESIZE, mmap.PAGESIZE, mmap.PROT_READ) != 0:
+    raise OSError(ctypes.get_errno(), 'mprotect failed')
+print('ready', address, flush=True)
+while True:
+    time.sleep(0.01)
+'''
+
+
+class ChildMemoryTest(AttachedChildTest):
+    script = _two_page_mapper
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(self.process.close)
+        self.address = int(self.ready_line[1])
+        self.read_only_address = self.address + mmap.PAGESIZE
+
+    def test_write_iov_read_iov(self):
+        writes = [(self.address + 100, (ctypes.c_uint8 * 5)(1, 2, 3, 4, 5)),
+                  (self.address + 8, ctypes.c_int32(-123456)),
+                  (self.address + 200, ctypes.c_double(2.5))]
+        self.process.write_iov(writes)
+
+        reads = [(address, type(buffer)()) for address, buffer in writes]
+        self.assertEqual([bytes(buffer) for buffer in self.process.read_iov(reads)],
+                         [bytes(buffer) for _address, buffer in writes])
+        self.assertEqual(self.process.read_bytes(self.address + 100, 5), b'\x01\x02\x03\x04\x05')
+
+    def test_frame_before_flag(self):
+        # As in main.py: the flag (handing the buffer over) goes after the frame in one write_iov()
+        flag_address = self.address
+        frame = (ctypes.c_uint8 * 64)(*range(64))
+        self.process.write_iov([(self.address + 16, frame), (flag_address, ctypes.c_uint8(128))])
+        self.assertEqual(self.process.read_bytes(self.address + 16, 64), bytes(frame))
+        self.assertEqual(self.process.read_bytes(flag_address, 1), b'\x80')
+
+        # A frame which can only be partly written (it runs into the read-only page) must not
+        #  be followed by the flag
+        self.process.write_memory(flag_address, ctypes.c_uint8(0))
+        frame_address = self.read_only_address - 32
+        with self.assertRaises(linux.MemEditError):
+            self.process.write_iov([(frame_address, frame), (flag_address, ctypes.c_uint8(128))])
+        self.assertEqual(self.process.read_bytes(frame_address, 32), bytes(frame)[:32])
+        self.assertEqual(self.process.read_bytes(flag_address, 1), b'\x00')
+
+    def test_write_memory_pointer(self):
+        data = (ctypes.c_uint8 * 16)(*range(100, 116))
+        pointer = ctypes.cast(data, ctypes.POINTER(ctypes.c_uint8))
+        self.process.write_memory_pointer(self.address + 300, pointer, 16)
+        self.assertEqual(self.process.read_bytes(self.address + 300, 16), bytes(data))
+
+    def test_write_iov_to_read_only_page_raises(self):
+        with self.assertRaises(OSError):
+            self.process.write_iov([(self.read_only_address, ctypes.c_uint32(0xdeadbeef))])
+        self.assertEqual(self.process.read_bytes(self.read_only_address, 4), bytes(4))
+
+    def test_read_bytes(self):
+        self.process.write_memory(self.address + 40, (ctypes.c_char * 6)(*b'abcdef'))
+        self.assertEqual(self.process.read_bytes(self.address + 40, 6), b'abcdef')
+
+        # Across the boundary into the read-only page
+        self.process.write_memory(self.read_only_address - 3, (ctypes.c_char * 3)(*b'xyz'))
+        self.assertEqual(self.process.read_bytes(self.read_only_address - 3, 6), b'xyz\x00\x00\x00')
+
+
+if __name__ == '__main__':
+    unittest.main()
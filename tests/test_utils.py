@@ -0,0 +1,133 @@
+"""
+Tests for the buffer search functions in mem_edit.utils, checked against bytes.find()
+"""
+
+import ctypes
+import random
+import unittest
+from unittest import mock
+
+from mem_edit import utils
+
+
+def find_all(needle: bytes, haystack: bytes, align: int = 1) -> list:
+    """
+    Reference implementation: every (possibly overlapping) offset of `needle` in `haystack`
+      which is a multiple of `align`.
+    """
+    found = []
+    offset = haystack.find(needle)
+    while offset != -1 and offset < len(haystack):
+        if offset % align == 0:
+            found.append(offset)
+        offset = haystack.find(needle, offset + 1)
+    return found
+
+
+def make_haystack(rng: random.Random, size: int, needle: bytes) -> bytes:
+    """
+    Random bytes from a small alphabet (so partial matches are common), with copies of
+      `needle` planted at aligned and unaligned offsets.
+    """
+    alphabet = sorted(set(needle) | {0, 1}) if needle else [0, 1]
+    haystack = bytearray(rng.choice(alphabet) for _ in range(size))
+    for _ in range(max(1, size // 512)):
+        if len(needle) <= size:
+            offset = rng.randrange(size - len(needle) + 1)
+            haystack[offset:offset + len(needle)] = needle
+    return bytes(haystack)
+
+
+def as_ctypes(data: bytes) -> ctypes.Array:
+    return (ctypes.c_char * len(data)).from_buffer_copy(data)
+
+
+class SearchBufferVerbatimTest(unittest.TestCase):
+    # Small haystacks go through bytes.find; ones over 64KiB through the compiled BMH loop
+    #  (its threshold is lowered from several MiB to keep the haystacks quick to generate)
+    haystack_sizes = (0, 1, 7, 100, 4096, 70000)
+    needle_sizes = (1, 2, 3, 4, 5, 8, 12, 16, 17)
+    aligns = (1, 2, 3, 4, 8)
+
+    def setUp(self):
+        patcher = mock.patch.object(utils, '_bmh_min_haystack_size', 64 * 1024)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def check(self, search):
+        rng = random.Random(1234)
+        for needle_size in self.needle_sizes:
+            needle = bytes(rng.randrange(256) for _ in range(needle_size))
+            for haystack_size in self.haystack_sizes:
+                haystack = make_haystack(rng, haystack_size, needle)
+                for align in self.aligns:
+                    with self.subTest(needle_size=needle_size, haystack_size=haystack_size, align=align):
+                        expected = find_all(needle, haystack, align)
+                        self.assertEqual(search(as_ctypes(needle), as_ctypes(haystack), align), expected)
+
+    def test_search_buffer_verbatim(self):
+        self.check(utils.search_buffer_verbatim)
+
+    def test_compile_needle_scanner(self):
+        self.check(lambda needle, haystack, align: utils.compile_needle_scanner(needle, align)(haystack))
+
+    def test_without_numba(self):
+        with mock.patch.object(utils, '_get_numba', lambda: None):
+            self.check(utils.search_buffer_verbatim)
+
+    def test_without_numpy(self):
+        with mock.patch.object(utils, 'numpy', None), mock.patch.object(utils, '_get_numba', lambda: None):
+            self.check(utils.search_buffer_verbatim)
+
+    def test_integer_needles(self):
+        rng = random.Random(5678)
+        for needle_type in (ctypes.c_uint8, ctypes.c_int16, ctypes.c_int32, ctypes.c_uint64):
+            needle = needle_type(rng.randrange(1 << 7))
+            haystack = make_haystack(rng, 70000, bytes(needle))
+            for align in self.aligns:
+                with self.subTest(needle_type=needle_type.__name__, align=align):
+                    expected = find_all(bytes(needle), haystack, align)
+                    self.assertEqual(utils.search_buffer_verbatim(needle, as_ctypes(haystack), align), expected)
+
+    def test_haystack_types(self):
+        rng = random.Random(91011)
+        needle = b'\x12\x34\x56'
+        for size in (100, 70000):
+            haystack = make_haystack(rng, size, needle)
+            expected = find_all(needle, haystack)
+            for converted in (haystack, bytearray(haystack), memoryview(haystack), as_ctypes(haystack)):
+                with self.subTest(size=size, haystack_type=type(converted).__name__):
+                    self.assertEqual(utils.search_buffer_verbatim(as_ctypes(needle), converted), expected)
+
+    def test_empty_needle(self):
+        for size in (0, 10, 70000):
+            haystack = bytes(size)
+            with self.subTest(size=size):
+                self.assertEqual(utils.search_buffer_verbatim(as_ctypes(b''), haystack), find_all(b'', haystack))
+
+
+class SearchBufferTest(unittest.TestCase):
+    aligns = (1, 2, 3, 4)
+
+    def check(self):
+        rng = random.Random(4321)
+        needles = [ctypes.c_uint8(7), ctypes.c_uint16(0x0102), ctypes.c_int32(0x01000100),
+                   (ctypes.c_uint8 * 3)(1, 0, 1)]
+        for needle in needles:
+            for size in (0, 3, 200, 3000):
+                haystack = make_haystack(rng, size, bytes(needle))
+                for align in self.aligns:
+                    with self.subTest(needle=type(needle).__name__, size=size, align=align):
+                        expected = find_all(bytes(needle), haystack, align)
+                        self.assertEqual(utils.search_buffer(needle, bytearray(haystack), align), expected)
+
+    def test_search_buffer(self):
+        self.check()
+
+    def test_without_numba(self):
+        with mock.patch.object(utils, '_get_numba', lambda: None):
+            self.check()
+
+
+if __name__ == '__main__':
+    unittest.main()
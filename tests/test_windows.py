@@ -0,0 +1,47 @@
+"""
+Tests for the Windows Process implementation
+"""
+
+import platform
+import unittest
+from unittest import mock
+
+if platform.system() == 'Windows':
+    from mem_edit import windows
+
+
+@unittest.skipUnless(platform.system() == 'Windows', 'Windows only')
+class PidsByNameTest(unittest.TestCase):
+    # Executable path reported for each pid (None: the process couldn't be queried)
+    paths = {
+        4: None,
+        100: 'C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe',
+        200: 'C:\\Windows\\System32\\notepad.exe',
+        300: 'C:\\Users\\user\\CHROME.EXE',
+        400: 'C:\\Tools\\notchrome.exe',
+        500: 'chrome.exe',
+        600: 'C:/msys64/chrome.exe',
+        700: 'C:\\chrome.exe\\other.exe',
+        }
+
+    def setUp(self):
+        for name, replacement in (('list_available_pids', lambda: list(self.paths)),
+                                  ('_probe_path', self.paths.get)):
+            patcher = mock.patch.object(windows.Process, name, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_matches_basename(self):
+        self.assertEqual(windows.Process.get_pids_by_name('chrome.exe'), [100, 300, 500, 600])
+        self.assertEqual(windows.Process.get_pid_by_name('notepad.exe'), 200)
+
+    def test_case_insensitive(self):
+        self.assertEqual(windows.Process.get_pids_by_name('Chrome.EXE'), [100, 300, 500, 600])
+
+    def test_no_match(self):
+        self.assertEqual(windows.Process.get_pids_by_name('chrome'), [])
+        self.assertIsNone(windows.Process.get_pid_by_name('hrome.exe'))
+
+
+if __name__ == '__main__':
+    unittest.main()